@@ -2,34 +2,85 @@
 BaseReader
 
 A very simple extended stream reader, with capability to read single or 
-arrays of standard types.
+arrays of standard types. The whole file is read into memory on opening,
+and values are unpacked directly from that buffer.
 
 It additionally has functions to read a uint-prefixed string, and a 
 uint-prefixed list of some item, defined by the function passed in
 """
 
 import struct
+import functools
 from collections import namedtuple
 
-from .mathtypes import Vector, Matrix, Quaternion, sequence_to_matrix
+from .mathtypes import Vector, Matrix, Quaternion, sequence_to_matrix, sequence_to_quaternion
+
+try:
+  import numpy
+except ImportError:
+  # Blender always ships numpy, but allow standalone reading without it
+  numpy = None
 
 import logging
 logger = logging.getLogger(__name__)
 
+# Precompiled unpackers for the single-value reads, which make up the bulk
+# of the calls when parsing a file
+_uchar = struct.Struct("B").unpack_from
+_ushort = struct.Struct("<H").unpack_from
+_uint = struct.Struct("<I").unpack_from
+_uint_be = struct.Struct(">I").unpack_from
+_int = struct.Struct("<i").unpack_from
+_float = struct.Struct("<f").unpack_from
+_double = struct.Struct("<d").unpack_from
+_matrixf = struct.Struct("<16f")
+_matrixd = struct.Struct("<16d")
+_vec2f = struct.Struct("<2f")
+_vec3f = struct.Struct("<3f")
+_vec3d = struct.Struct("<3d")
+
+# Compiled structs for ad-hoc formats, so that they are only parsed and sized
+# once however many times they are read. Bounded, as the file contents could
+# otherwise grow it for the whole session
+_compile_format = functools.lru_cache(maxsize=128)(struct.Struct)
+
 class BaseReader(object):
   def __init__(self, filename):
     self.filename = filename
-    self.stream = open(filename, "rb")
+    with open(filename, "rb") as f:
+      self.buffer = f.read()
+    self.offset = 0
     self.version = None
+    self.strings = None
+    self._decoded_strings = {}
+
+  @property
+  def version(self):
+    return self._version
+
+  @version.setter
+  def version(self, value):
+    self._version = value
+    # Pick the general string reader once, rather than checking the version
+    # for every string read
+    if value == 10:
+      self.read_string = self.read_lookup_string
+    else:
+      self.read_string = self.read_prefixed_string
 
   def tell(self):
-    return self.stream.tell()
+    return self.offset
 
   def seek(self, offset, from_what=0):
-    self.stream.seek(offset, from_what)
+    if from_what == 1:
+      offset += self.offset
+    elif from_what == 2:
+      offset += len(self.buffer)
+    self.offset = offset
 
   def close(self):
-    self.stream.close()
+    self.buffer = b""
+    self.offset = 0
 
   @property
   def v8(self):
@@ -39,80 +90,132 @@ class BaseReader(object):
     return self.version == 10
 
   def read_constant(self, data):
-    filedata = self.stream.read(len(data))
+    filedata = self.read(len(data))
     if not data == filedata:
       raise IOError("Expected constant not encountered; {} != {}".format(filedata, data))
 
   def read(self, length):
-    return self.stream.read(length)
+    data = self.buffer[self.offset:self.offset+length]
+    self.offset += len(data)
+    return data
+
+  def _unpack_array(self, format, count, size):
+    values = struct.unpack_from(format.format(count), self.buffer, self.offset)
+    self.offset += size*count
+    return values
     
   def read_uchar(self):
-    return struct.unpack("B", self.stream.read(1))[0]
+    value = _uchar(self.buffer, self.offset)[0]
+    self.offset += 1
+    return value
 
   def read_uchars(self, count):
-    return struct.unpack("{}B".format(count), self.stream.read(1*count))
+    return self._unpack_array("{}B", count, 1)
 
   def read_ushort(self):
-    return struct.unpack("<H", self.stream.read(2))[0]
+    value = _ushort(self.buffer, self.offset)[0]
+    self.offset += 2
+    return value
 
   def read_ushorts(self, count):
-    return struct.unpack("<{}H".format(count), self.stream.read(2*count))
+    return self._unpack_array("<{}H", count, 2)
 
   def read_uint(self):
     """Read an unsigned integer from the data"""
-    return struct.unpack("<I", self.stream.read(4))[0]
+    value = _uint(self.buffer, self.offset)[0]
+    self.offset += 4
+    return value
 
   def read_uints(self, count):
     """Read an unsigned integer from the data"""
-    return struct.unpack("<{}I".format(count), self.stream.read(4*count))
+    return self._unpack_array("<{}I", count, 4)
 
   def read_uint_be(self):
     """Read a big-endian unsigned integer from the data"""
-    return struct.unpack(">I", self.stream.read(4))[0]
+    value = _uint_be(self.buffer, self.offset)[0]
+    self.offset += 4
+    return value
 
   def read_int(self):
     """Read a signed integer from the data"""
-    return struct.unpack("<i", self.stream.read(4))[0]
+    value = _int(self.buffer, self.offset)[0]
+    self.offset += 4
+    return value
   
   def read_ints(self, count):
     """Read a signed integer from the data"""
-    return struct.unpack("<{}i".format(count), self.stream.read(4*count))
+    return self._unpack_array("<{}i", count, 4)
 
   def read_float(self):
-    return struct.unpack("<f", self.stream.read(4))[0]
+    value = _float(self.buffer, self.offset)[0]
+    self.offset += 4
+    return value
 
   def read_floats(self, count):
-    return struct.unpack("<{}f".format(count), self.stream.read(4*count))
+    return self._unpack_array("<{}f", count, 4)
   
   def read_double(self):
-    return struct.unpack("<d", self.stream.read(8))[0]  
+    value = _double(self.buffer, self.offset)[0]
+    self.offset += 8
+    return value
 
   def read_doubles(self, count):
-    return struct.unpack("<{}d".format(count), self.stream.read(8*count))
+    return self._unpack_array("<{}d", count, 8)
+
+  def read_array(self, typecode, count, stride=None):
+    """Read a block of values of a single struct type code e.g. 'f'; as a
+    numpy array, if numpy is available. If a stride is given, the values are
+    grouped into rows of that many values."""
+    if numpy is None:
+      values = self._unpack_array("<{}"+typecode, count, _compile_format("<"+typecode).size)
+      if stride:
+        return [values[i:i+stride] for i in range(0, count, stride)]
+      return values
+    dtype = numpy.dtype("<"+typecode)
+    # View the values in place in the file buffer rather than copying a slice
+    # out first; frombuffer raises if the buffer is too short for count
+    values = numpy.frombuffer(self.buffer, dtype=dtype, count=count, offset=self.offset)
+    self.offset += dtype.itemsize*count
+    if stride:
+      return values.reshape(-1, stride)
+    return values
+
+  def read_struct(self, compiled):
+    """Read the values of a precompiled struct.Struct from the data"""
+    values = compiled.unpack_from(self.buffer, self.offset)
+    self.offset += compiled.size
+    return values
 
   def read_format(self, format):
     """Read a struct format from the data"""
-    return struct.unpack(format, self.stream.read(struct.calcsize(format)))
-
-  def read_string(self, lookup=True):
-    """Read a length-prefixed string from the file.
-    lookup: If v10, string will be read as lookup. Has no effect on v8"""
-
-    prepos = self.stream.tell()
-    if self.v10 and lookup:
-      index = self.read_uint()
-      assert index < len(self.strings), "Got index higher than lookup count; {} at {}".format(index, prepos)
-      return self.strings[index]
-    else:
-      length = self.read_uint()
-      assert length < 200, "Overly long string length found; {} at {}".format(length, prepos)
-      try:
-        data = self.stream.read(length)
-        # return data.decode("UTF-8")
-        return data.decode("windows-1251")
-      except UnicodeDecodeError:
-        print("Bad data:100 : " + repr(data[:100]))
-        raise RuntimeError("Could not decode string with length {} at position {}".format(length, prepos))
+    return self.read_struct(_compile_format(format))
+
+  def read_lookup_string(self):
+    """Read a v10 string, stored as an index into the string lookup table"""
+    prepos = self.offset
+    index = self.read_uint()
+    assert index < len(self.strings), "Got index higher than lookup count; {} at {}".format(index, prepos)
+    # The lookup table is only decoded as entries are used
+    try:
+      return self._decoded_strings[index]
+    except KeyError:
+      string = self.strings[index].decode("windows-1251")
+      self._decoded_strings[index] = string
+      return string
+
+  def read_prefixed_string(self):
+    """Read a length-prefixed string from the file. This is how all v8
+    strings are stored, and a few (e.g. node names) in v10"""
+    prepos = self.offset
+    length = self.read_uint()
+    assert length < 200, "Overly long string length found; {} at {}".format(length, prepos)
+    try:
+      data = self.read(length)
+      # return data.decode("UTF-8")
+      return data.decode("windows-1251")
+    except UnicodeDecodeError:
+      print("Bad data:100 : " + repr(data[:100]))
+      raise RuntimeError("Could not decode string with length {} at position {}".format(length, prepos))
 
   def read_list(self, reader):
     """Reads a length-prefixed list of something"""
@@ -126,24 +229,23 @@ class BaseReader(object):
     return entries
 
   def read_vec2f(self):
-    return Vector(self.read_format("<ff"))
+    return Vector(self.read_struct(_vec2f))
 
   def read_vec3f(self):
-    return Vector(self.read_format("<fff"))
+    return Vector(self.read_struct(_vec3f))
 
   def read_vec3d(self):
-    return Vector(self.read_format("<ddd"))
+    return Vector(self.read_struct(_vec3d))
 
   def read_matrixf(self):
-    md = self.read_floats(16)
+    md = self.read_struct(_matrixf)
     return sequence_to_matrix(md)
 
   def read_matrixd(self):
-    md = self.read_doubles(16)
+    md = self.read_struct(_matrixd)
     return sequence_to_matrix(md)
 
   def read_quaternion(self):
-    qd = self.read_doubles(4)
-    # Reorder as osg saves xyzw and we want wxyz
-    return Quaternion([qd[3], qd[0], qd[1], qd[2]])
+    # Reordered as osg saves xyzw and we want wxyz
+    return sequence_to_quaternion(self.read_doubles(4))
 
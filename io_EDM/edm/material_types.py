@@ -1,13 +1,16 @@
 
 from collections import OrderedDict, namedtuple, Counter
+import itertools
+import struct
 
 from .typereader import AnimatedProperty, ArgumentProperty
 
-from .mathtypes import Vector
+from .mathtypes import Vector, sequence_to_matrix
 from .propertiesset import PropertiesSet
 
 # The known vertex channels
 _vertex_channels = {"position": 0, "normal": 1, "tex0": 4, "bones": 21}
+_known_channels = frozenset(_vertex_channels.values())
 
 Texture = namedtuple("Texture", ["index", "name", "matrix"])
 
@@ -37,6 +40,15 @@ class VertexFormat(object):
     self.nposition = int(self.data[0])
     self.nnormal = int(self.data[1])
     self.ntexture = int(self.data[4])
+
+    # Offset of every channel into a single vertex, and the full vertex size
+    offsets = [0] + list(itertools.accumulate(self.data))
+    self.offsets = offsets[:-1]
+    self.stride = offsets[-1]
+
+    self.position_indices = [0,1,2]
+    self.normal_indices = list(range(self.offsets[1], self.offsets[1]+self.nnormal))
+    self.texture_indices = list(range(self.offsets[4], self.offsets[4]+self.ntexture))
   
   def __hash__(self):
     return hash(self.data)
@@ -44,20 +56,6 @@ class VertexFormat(object):
   def __eq__(self, other):
     return self.data == other.data
 
-  @property
-  def position_indices(self):
-    return [0,1,2]
-
-  @property
-  def normal_indices(self):
-    start = self.data[0]
-    return list(range(start, start+self.nnormal))
-
-  @property
-  def texture_indices(self):
-    start = sum(self.data[:4])
-    return list(range(start, start+self.ntexture))
-
   def __repr__(self):
     assert all(x < 10 for x in self.data)
     return "VertexFormat('{}')".format("".join(str(x) for x in self.data))
@@ -68,8 +66,7 @@ class VertexFormat(object):
     data = reader.read_uchars(channels)
 
     # Which channels have data?
-    knownChannels = set(_vertex_channels.values())
-    dataChannels = {i: x for i, x in enumerate(data) if x != 0 and not i in knownChannels} 
+    dataChannels = {i: x for i, x in enumerate(data) if x != 0 and not i in _known_channels}
     if dataChannels:
       print("Warning: Vertex channel data in unrecognised channels: {}".format(dataChannels))
     return cls(data)
@@ -78,12 +75,14 @@ class VertexFormat(object):
     writer.write_uint(len(self.data))
     writer.write(self.data)
 
+# Four unknown uints, followed by the texture matrix
+_texture_matrix = struct.Struct("<16x16f")
+
 def _read_material_texture(reader):
   index = reader.read_uint()
   reader.read_int() # unknown
-  name = reader.read_string(lookup=False)
-  reader.read_uints(4) # unknown
-  matrix = reader.read_matrixf()
+  name = reader.read_prefixed_string()
+  matrix = sequence_to_matrix(reader.read_struct(_texture_matrix))
   return Texture(index, name, matrix)
 
 def _read_animateduniforms(stream):
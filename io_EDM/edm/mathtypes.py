@@ -15,9 +15,11 @@ try:
 except ImportError:
   # We don't have mathutils. Make some very basic replacements.
   class Vector(tuple):
+    __slots__ = ()
     def __repr__(self):
       return "Vector({})".format(super(Vector, self).__repr__())
   class Matrix(tuple):
+    __slots__ = ()
     def transposed(self):
       cols = [[self[j][i] for j in range(len(self))] for i in range(len(self))]
       return Matrix(cols)
@@ -25,6 +27,7 @@ except ImportError:
       return "Matrix({})".format(super(Matrix, self).__repr__())
 
   class Quaternion(tuple):
+    __slots__ = ()
     def ___repr__(self):
       return "Quaternion({})".format(super(Quaternion, self).__repr__())
 
@@ -34,7 +37,8 @@ def MatrixScale(vector):
   return mat
 
 def sequence_to_matrix(seq):
-  return Matrix([seq[:4], seq[4:8], seq[8:12], seq[12:16]]).transposed()
+  # The sequence is column-major, so every row is each fourth value
+  return Matrix((seq[0::4], seq[1::4], seq[2::4], seq[3::4]))
 
 def matrix_to_sequence(mat):
   xp = mat.transposed()
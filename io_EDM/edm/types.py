@@ -14,7 +14,7 @@ from collections import namedtuple, OrderedDict, Counter
 import itertools
 import struct
 
-from .mathtypes import Vector, sequence_to_matrix, Matrix, Quaternion
+from .mathtypes import Vector, sequence_to_matrix, sequence_to_quaternion, Matrix, Quaternion
 
 from abc import ABC
 from enum import Enum
@@ -40,13 +40,6 @@ _all_IndexA = {'model::TransformNode', 'model::FakeOmniLightsNode', 'model::Skin
 _all_IndexB = {'model::Key<key::ROTATION>', 'model::Property<float>', 'model::ArgAnimationNode::Position', '__pointers', 'model::FakeOmniLight', 'model::Key<key::SCALE>', 'model::AnimatedProperty<osg::Vec3f>', 'model::Key<key::VEC3F>', 'model::Property<osg::Vec2f>', 'model::Property<osg::Vec3f>', 'model::ArgAnimationNode::Rotation', 'model::ArgVisibilityNode::Range', 'model::Key<key::POSITION>', 'model::AnimatedProperty<osg::Vec2f>', 'model::Key<key::FLOAT>', '__ci_bytes', '__gv_bytes', 'model::ArgVisibilityNode::Arg', 'model::AnimatedProperty<float>', 'model::RNControlNode', 'model::SegmentsNode::Segments', '__gi_bytes', '__cv_bytes', 'model::Property<unsigned int>', 'model::Key<key::VEC2F>', 'model::ArgAnimationNode::Scale', 'model::LodNode::Level', 'model::PropertiesSet', 'model::FakeSpotLight'}
 
 
-def get_type_reader(name):
-  _readfun = _tr_get_type_reader(name)
-  def _reader(reader):
-    reader.typecount[name] += 1
-    return _readfun(reader)
-  return _reader
-
 class TrackingReader(BaseReader):
   def __init__(self, *args, **kwargs):
     self.typecount = Counter()
@@ -60,7 +53,9 @@ class TrackingReader(BaseReader):
     assert selfOrNone is None or selfOrNone is self
     typeName = self.read_string()
     try:
-      return get_type_reader(typeName)(self)
+      readfun = _tr_get_type_reader(typeName)
+      self.typecount[typeName] += 1
+      return readfun(self)
     except KeyError:
       print("Error at position {}".format(self.tell()))
       raise
@@ -122,8 +117,9 @@ class EDMFile(object):
     if reader.v10:
       stringsize = reader.read_uint()
       sdata = reader.read(stringsize)
-      # Split by null byte and filter out empty strings
-      reader.strings = [x.decode("windows-1251") for x in sdata.split(b'\x00') if x]
+      # Split by null byte and filter out empty strings. These are decoded
+      # by the reader when first used.
+      reader.strings = [x for x in sdata.split(b'\x00') if x]
     else:
       reader.strings = None
 
@@ -292,7 +288,7 @@ class BaseNode(GraphNode):
   @classmethod
   def read(cls, stream):
     node = cls()
-    node.name = stream.read_string(lookup=False)
+    node.name = stream.read_prefixed_string()
     node.version = stream.read_uint()
     node.props = PropertiesSet.read(stream, count=False)
     return node
@@ -521,7 +517,8 @@ class ArgRotationNode(ArgAnimationNode):
     stream.mark_type_read("model::ArgAnimationNode::Rotation")
     arg = stream.read_uint()
     count = stream.read_uint()
-    keys = [get_type_reader("model::Key<key::ROTATION>")(stream) for _ in range(count)]
+    keys = RotationKey.read_array(stream, count)
+    stream.mark_type_read("model::Key<key::ROTATION>", count)
     return (arg, keys)
 
 @reads_type("model::ArgPositionNode")
@@ -538,7 +535,8 @@ class ArgPositionNode(ArgAnimationNode):
     stream.mark_type_read("model::ArgAnimationNode::Position")
     arg = stream.read_uint()
     count = stream.read_uint()
-    keys = [get_type_reader("model::Key<key::POSITION>")(stream) for _ in range(count)]
+    keys = PositionKey.read_array(stream, count)
+    stream.mark_type_read("model::Key<key::POSITION>", count)
     return (arg, keys)
 
 @reads_type("model::ArgScaleNode")
@@ -555,51 +553,81 @@ class ArgScaleNode(ArgAnimationNode):
     count = stream.read_uint()
     # Weirdly seems to be two sets of keys; one with 4-components and one with three
     # keys = [get_type_reader("model::Key<key::SCALE>")(stream) for _ in range(count)]
-    keys = [ScaleKey.read(stream, 4) for _ in range(count)]
+    keys = ScaleKey.read_array(stream, count, 4)
     count2 = stream.read_uint()
     # Second set of keys only has three components...?
-    key2s = [ScaleKey.read(stream, 3) for _ in range(count2)]
+    key2s = ScaleKey.read_array(stream, count2, 3)
     # print("Edn of scale arg at ", steam.tell())
     return (arg, (keys, key2s))
 
 
+# Fixed layouts of the animation keys; a double frame followed by the value
+_rotation_key = struct.Struct("<d4d")
+_position_key = struct.Struct("<d3d")
+
 @reads_type("model::Key<key::ROTATION>")
 class RotationKey(object):
+  __slots__ = ("frame", "value")
   def __init__(self, frame=None, value=None):
     self.frame = frame
     self.value = value
   @classmethod
   def read(cls, stream):
     self = cls()
-    self.frame = stream.read_double()
-    self.value = stream.read_quaternion()
+    data = stream.read_struct(_rotation_key)
+    self.frame = data[0]
+    self.value = sequence_to_quaternion(data[1:])
     return self
 
+  @classmethod
+  def read_array(cls, stream, count):
+    """Reads a packed array of keys with a single unpack"""
+    data = stream.read_doubles(5*count)
+    return [cls(data[i], sequence_to_quaternion(data[i+1:i+5])) for i in range(0, len(data), 5)]
+
   def __repr__(self):
     return "Key(frame={}, value={})".format(self.frame, repr(self.value))
 
 @reads_type("model::Key<key::POSITION>")
 class PositionKey(object):
+  __slots__ = ("frame", "value")
   def __init__(self, frame=None, value=None):
     self.frame = frame
     self.value = value
   @classmethod
   def read(cls, stream):
     self = cls()
-    self.frame = stream.read_double()
-    self.value = Vector(stream.read_doubles(3))
+    data = stream.read_struct(_position_key)
+    self.frame = data[0]
+    self.value = Vector(data[1:])
     return self
+
+  @classmethod
+  def read_array(cls, stream, count):
+    """Reads a packed array of keys with a single unpack"""
+    data = stream.read_doubles(4*count)
+    return [cls(data[i], Vector(data[i+1:i+4])) for i in range(0, len(data), 4)]
+
   def __repr__(self):
     return "Key(frame={}, value={})".format(self.frame, repr(self.value))
 
 @reads_type("model::Key<key::SCALE>")
 class ScaleKey(object):
+  __slots__ = ("frame", "value")
+  def __init__(self, frame=None, value=None):
+    self.frame = frame
+    self.value = value
   @classmethod
   def read(cls, stream, entrylength):
-    self = cls()
-    self.frame = stream.read_double()
-    self.value = Vector(stream.read_doubles(entrylength))
-    return self
+    return cls.read_array(stream, 1, entrylength)[0]
+
+  @classmethod
+  def read_array(cls, stream, count, entrylength):
+    """Reads a packed array of keys with a single unpack"""
+    size = entrylength + 1
+    data = stream.read_doubles(size*count)
+    return [cls(data[i], Vector(data[i+1:i+size])) for i in range(0, len(data), size)]
+
   def __repr__(self):
     return "Key(frame={}, value={})".format(self.frame, repr(self.value))
 
@@ -674,13 +702,13 @@ def _read_index_data(stream, classification=None):
   unknown = stream.read_uint()
 
   if dataType == 0:
-    data = stream.read_uchars(entries)
+    data = stream.read_array("B", entries)
     _bytes = entries
   elif dataType == 1:
-    data = stream.read_ushorts(entries)
+    data = stream.read_array("H", entries)
     _bytes = entries * 2
   elif dataType == 2:
-    data = stream.read_uints(entries)
+    data = stream.read_array("I", entries)
     _bytes = entries * 4
   else:
     raise IOError("Don't know how to read index data type {} @ {}".format(int(dataType), dtPos))
@@ -711,14 +739,13 @@ def _write_index_data(indexData, vertexDataLength, writer):
 def _read_vertex_data(stream, classification=None):
   count = stream.read_uint()
   stride = stream.read_uint()
-  vtxData = stream.read_floats(count*stride)
+  # Read the vertex data, grouped according to stride
+  vtxData = stream.read_array("f", count*stride, stride)
 
   # If given a classification, mark it off
   if classification:
     stream.mark_type_read(classification, count*stride*4)
 
-  # Group the vertex data according to stride
-  vtxData = [vtxData[i:i+stride] for i in range(0, len(vtxData), stride)]
   return vtxData
 
 def _write_vertex_data(data, writer):
@@ -727,6 +754,8 @@ def _write_vertex_data(data, writer):
   flat_data = list(itertools.chain(*data))
   writer.write_floats(flat_data)
 
+_parent_entry = struct.Struct("<Iii")
+
 def _read_parent_data(stream):
     # Read the parent section
   parentCount = stream.read_uint()
@@ -735,12 +764,9 @@ def _read_parent_data(stream):
   if parentCount == 1:
     return [[stream.read_uint(), stream.read_int()]]
   else:
-    parentData = []
-    for _ in range(parentCount):
-      node = stream.read_uint()
-      ranges = list(stream.read_ints(2))
-      parentData.append((node, ranges[0], ranges[1]))
-    return parentData
+    # Each entry is a node index and two ranges; unpack them all at once
+    data = stream.read(_parent_entry.size*parentCount)
+    return list(_parent_entry.iter_unpack(data))
 
 def _render_audit(self, verts="__gv_bytes", inds="__gi_bytes"):
   c = Counter()
@@ -5,7 +5,7 @@ Contains the central EDM->Blender conversion code
 """
 
 import bpy
-import bmesh
+import numpy
 
 from .utils import chdir, print_edm_graph
 from .edm import EDMFile
@@ -22,6 +22,9 @@ import itertools
 
 FRAME_SCALE = 100
 
+# Enum properties are bulk-written with foreach_set as their integer values
+_LINEAR_INTERPOLATION = bpy.types.Keyframe.bl_rna.properties["interpolation"].enum_items["LINEAR"].value
+
 def iterate_renderNodes(edmFile):
   """Iterates all renderNodes in an edmFile - whilst ignoring any nesting
   due to e.g. renderNode splitting"""
@@ -195,8 +198,9 @@ def read_file(filename, options={}):
   # We need to change the directory as the material searcher
   # currently uses the cwd
   with chdir(os.path.dirname(os.path.abspath(filename))):
+    texture_files = _list_texture_files()
     for material in edm.root.materials:
-      material.blender_material = create_material(material)
+      material.blender_material = create_material(material, texture_files)
       if material.blender_material and options.get("shadeless", False):
         material.blender_material.use_shadeless = True
 
@@ -241,51 +245,69 @@ def create_visibility_actions(visNode):
         key.interpolation = 'CONSTANT'
   return actions
 
-def add_position_fcurves(action, keys, transform_left, transform_right):
-  "Adds position fcurve data to an animation action"
+def _add_linear_fcurve(action, data_path, index, frames, values):
+  "Adds an fcurve with linearly interpolated keyframes, set in bulk"
+  curve = action.fcurves.new(data_path=data_path, index=index)
+  points = curve.keyframe_points
+  points.add(len(frames))
+  co = numpy.empty(2*len(frames), dtype=numpy.float32)
+  co[0::2] = frames
+  co[1::2] = values
+  points.foreach_set("co", co)
+  points.foreach_set("interpolation", numpy.full(len(frames), _LINEAR_INTERPOLATION, dtype=numpy.int32))
+  curve.update()
+  return curve
+
+def _scaled_frames(keys):
+  "Returns the frame numbers of a set of keys, scaled to fit in FRAME_SCALE"
   maxFrame = max(abs(x.frame) for x in keys) or 1.0
   frameScale = float(FRAME_SCALE) / maxFrame
-  # Create an fcurve for every component  
-  curves = []
+  return [int(frameScale*x.frame) for x in keys]
+
+def _merge_keysets(keysets, kind):
+  """Combines the sets of keys for one argument into a single list of keys,
+  with their scaled frame numbers. Only the first key for any frame is kept,
+  as later ones would give duplicate keyframes with different values"""
+  if len(keysets) > 1:
+    print("Warning: Combining {} sets of {} keys for one argument".format(len(keysets), kind))
+  frames = []
+  keys = []
+  seen = set()
+  for keyset in keysets:
+    for frame, key in zip(_scaled_frames(keyset), keyset):
+      if frame in seen:
+        continue
+      seen.add(frame)
+      frames.append(frame)
+      keys.append(key)
+  skipped = sum(len(x) for x in keysets) - len(keys)
+  if skipped:
+    print("Warning: Skipped {} {} keys with duplicate frames".format(skipped, kind))
+  return frames, keys
+
+def add_position_fcurves(action, keysets, transform_left, transform_right):
+  """Adds position fcurve data to an animation action. Every set of keys is
+  combined into the same fcurves."""
+  frames, keys = _merge_keysets(keysets, "position")
+  # Calculate the position transformation for every keyframe
+  positions = numpy.array([
+    (transform_left * Matrix.Translation(x.value) * transform_right).decompose()[0]
+    for x in keys])
+
+  # Create an fcurve for every component
   for i in range(3):
-    curve = action.fcurves.new(data_path="location", index=i)
-    curves.append(curve)
-
-  # Loop over every keyframe in this animation
-  for framedata in keys:
-    frame = int(frameScale*framedata.frame)
-    
-    # Calculate the rotation transformation
-    newPosMat = transform_left * Matrix.Translation(framedata.value) * transform_right
-    newPos = newPosMat.decompose()[0]
+    _add_linear_fcurve(action, "location", i, frames, positions[:, i])
 
-    for curve, component in zip(curves, newPos):
-      curve.keyframe_points.add()
-      curve.keyframe_points[-1].co = (frame, component)
-      curve.keyframe_points[-1].interpolation = 'LINEAR'
+def add_rotation_fcurves(action, keysets, transform_left, transform_right):
+  """Adds rotation fcurve action to an animation action. Every set of keys is
+  combined into the same fcurves."""
+  frames, keys = _merge_keysets(keysets, "rotation")
+  # Calculate the rotation transformation for every keyframe
+  rotations = numpy.array([transform_left * x.value * transform_right for x in keys])
 
-def add_rotation_fcurves(action, keys, transform_left, transform_right):
-  "Adds rotation fcurve action to an animation action"
-  maxFrame = max(abs(x.frame) for x in keys) or 1.0
-  frameScale = float(FRAME_SCALE) / maxFrame
-  
-  # Create an fcurve for every component  
-  curves = []
+  # Create an fcurve for every component
   for i in range(4):
-    curve = action.fcurves.new(data_path="rotation_quaternion", index=i)
-    curves.append(curve)
-
-  # Loop over every keyframe in this animation
-  for framedata in keys:
-    frame = int(frameScale*framedata.frame)
-    
-    # Calculate the rotation transformation
-    newRot = transform_left * framedata.value * transform_right
-
-    for curve, component in zip(curves, newRot):
-      curve.keyframe_points.add()
-      curve.keyframe_points[-1].co = (frame, component)
-      curve.keyframe_points[-1].interpolation = 'LINEAR'
+    _add_linear_fcurve(action, "rotation_quaternion", i, frames, rotations[:, i])
 
 def create_arganimation_actions(node):
   "Creates a set of actions to represent an ArgAnimationNode"
@@ -357,10 +379,10 @@ def create_arganimation_actions(node):
     rightPosition = aabS
 
     # Build the f-curves for the action
-    for pos in posData:
-      add_position_fcurves(action, pos, leftPosition, rightPosition)
-    for rot in rotData:
-      add_rotation_fcurves(action, rot, leftRotation, rightRotation)
+    if posData:
+      add_position_fcurves(action, posData, leftPosition, rightPosition)
+    if rotData:
+      add_rotation_fcurves(action, rotData, leftRotation, rightRotation)
   # Return these new actions
   return actions
 
@@ -383,35 +405,46 @@ def get_actions_for_node(node):
   return actions
 
 
-def _find_texture_file(name):
+def _list_texture_files():
+  """
+  Lists the files that textures may be loaded from, as pairs of directory
+  and file names; the current working directory, and then any subdirectory
+  called "textures/"
+  """
+  return [(directory, [os.path.basename(x) for x in glob.glob(os.path.join(directory, "*.*"))])
+          for directory in ("", "textures")]
+
+def _find_texture_file(name, texture_files=None):
   """
   Searches for a texture file given a basename without extension.
 
   The current working directory will be searched, as will any
   subdirectories called "textures/", for any file starting with the
-  designated name '{name}.'
+  designated name '{name}.'. Listings from _list_texture_files may be
+  passed in, so that the directories are not re-read for every texture.
   """
-  files = glob.glob(name+".*")
-  if not files:
-    matcher = re.compile(fnmatch.translate(name+".*"), re.IGNORECASE)
-    files = [x for x in glob.glob("*.*") if matcher.match(x)]
+  if texture_files is None:
+    texture_files = _list_texture_files()
+  pattern = name+".*"
+  matcher = re.compile(fnmatch.translate(pattern), re.IGNORECASE)
+  for directory, filenames in texture_files:
+    files = [x for x in filenames if fnmatch.fnmatchcase(x, pattern)]
     if not files:
-      files = glob.glob("textures/"+name+".*")
-      if not files:
-        matcher = re.compile(fnmatch.translate("textures/"+name+".*"), re.IGNORECASE)
-        files = [x for x in glob.glob("textures/*.*") if matcher.match(x)]
-        if not files:
-          print("Warning: Could not find texture named {}".format(name))
-          return None
+      files = [x for x in filenames if matcher.match(x)]
+    if files:
+      break
+  else:
+    print("Warning: Could not find texture named {}".format(name))
+    return None
   # print("Found {} as: {}".format(name, files))
   if len(files) > 1:
     print("Warning: Found more than one possible match for texture named {}. Using {}".format(name, files[0]))
-    files = [files[0]]
-  textureFilename = files[0]
+  textureFilename = os.path.join(directory, files[0])
   return os.path.abspath(textureFilename)
 
-def create_material(material):
-  """Create a blender node-based PBR material from an EDM one"""
+def create_material(material, texture_files=None):
+  """Create a blender node-based PBR material from an EDM one. Texture
+  directory listings may be passed in to be shared between materials."""
   # Create a new material
   mat = bpy.data.materials.new(name=material.name)
   mat.use_nodes = True
@@ -432,13 +465,13 @@ def create_material(material):
   # --- Handle Textures ---
   texture_nodes = {}
   for tex_def in material.textures:
-    filename = _find_texture_file(tex_def.name)
+    filename = _find_texture_file(tex_def.name, texture_files)
     if not filename:
       continue
 
     # Create image texture node
     tex_image = nodes.new('ShaderNodeTexImage')
-    tex_image.image = bpy.data.images.load(filename)
+    tex_image.image = bpy.data.images.load(filename, check_existing=True)
     tex_image.location = (-400, tex_def.index * -300)
     texture_nodes[tex_def.index] = tex_image
 
@@ -526,56 +559,48 @@ def apply_node_transform(node, obj):
       print("Warning: Transform {} has no zero-tranform".format(node))
 
 
+def _vectors_to_blender(data):
+  """Converts an (N, 3) array of EDM vectors to blender axes, in the same way
+  as vector_to_blender"""
+  return numpy.column_stack((data[:, 0], -data[:, 2], data[:, 1]))
+
 def _create_mesh(vertexData, indexData, vertexFormat):
   """Creates a blender mesh object from vertex, index and format data"""
 
   # We need to reduce the vertex set to match the index set
-  all_index = sorted(list(set(indexData)))
-  new_vertices = [vertexData[x] for x in all_index]
-  # new_indices = [i for i, _ in enumerate(all_index)]
-  indexMap = {idx: i for i, idx in enumerate(all_index)}
-  new_indices = [indexMap[x] for x in indexData]
-  # Make sure we have the right number of indices...
+  all_index, new_indices = numpy.unique(indexData, return_inverse=True)
+  new_vertices = numpy.asarray(vertexData)[all_index]
+  # Make sure we have the right number of indices...
   assert len(new_indices) % 3 == 0
 
-  bm = bmesh.new()
-
-  # Extract where the indices are
+  # Extract each vertex channel as a separate array
   posIndex = vertexFormat.position_indices
-  normIndex = vertexFormat.normal_indices
-  # Create the BMesh vertices, optionally with normals
-  for i, vtx in enumerate(new_vertices):
-    pos = vector_to_blender(Vector(vtx[x] for x in posIndex))
-    vert = bm.verts.new(pos)
-    if normIndex:
-      vert.normal = vector_to_blender(Vector(vtx[x] for x in normIndex))
-
-  bm.verts.ensure_lookup_table()
-
-  # Prepare for texture information
   uvIndex = vertexFormat.texture_indices
+  positions = _vectors_to_blender(new_vertices[:, posIndex])
   if uvIndex:
-    # Ensure a UV layer exists before creating faces
-    uv_layer = bm.loops.layers.uv.verify()
-    bm.faces.layers.tex.verify()  # currently blender needs both layers.
-  
-  # Generate faces, with texture coordinate information
-  for face in [new_indices[i:i+3] for i in range(0, len(new_indices), 3)]:
-  # for face, uvs in zip(indexData, uvData):
-    try:
-      f = bm.faces.new([bm.verts[i] for i in face])
-      # Add UV data if we have any
-      if uvIndex:
-        uvData = [[new_vertices[x][y] for y in uvIndex] for x in face]
-        for loop, uv in zip(f.loops, uvData):
-          loop[uv_layer].uv = (uv[0], 1-uv[1])
-    except ValueError as e:
-      print("Error: {}".format(e))
-
-  # Create the mesh object
+    uvs = new_vertices[:, uvIndex[:2]]
+    uvs[:, 1] = 1 - uvs[:, 1]
+
+  # Create the mesh object, filling the vertex and triangle data in bulk
   mesh = bpy.data.meshes.new("Mesh")
-  bm.to_mesh(mesh)
-  mesh.update()
+  mesh.vertices.add(len(positions))
+  mesh.vertices.foreach_set("co", positions.ravel())
+  loop_count = len(new_indices)
+  mesh.loops.add(loop_count)
+  mesh.loops.foreach_set("vertex_index", new_indices.astype(numpy.int32))
+  mesh.polygons.add(loop_count // 3)
+  mesh.polygons.foreach_set("loop_start", numpy.arange(0, loop_count, 3, dtype=numpy.int32))
+  mesh.polygons.foreach_set("loop_total", numpy.full(loop_count // 3, 3, dtype=numpy.int32))
+
+  # Every loop takes the texture coordinates of the vertex it uses
+  if uvIndex:
+    uv_layer = mesh.uv_layers.new()
+    uv_layer.data.foreach_set("uv", uvs[new_indices].ravel())
+
+  mesh.update(calc_edges=True)
+  # Duplicate or degenerate triangles are removed here
+  if mesh.validate():
+    print("Warning: Removed invalid geometry from mesh")
 
   return mesh
 